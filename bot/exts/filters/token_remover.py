@@ -1,11 +1,14 @@
 import base64
-import re
+import binascii
+import functools
+import string
 import typing as t
 
+import regex
 from discord import Colour, Message, NotFound
 from discord.ext.commands import Cog
+from pydis_core.utils import scheduling
 
-from bot import utils
 from bot.bot import Bot
 from bot.constants import Channels, Colours, Event, Icons
 from bot.exts.moderation.modlog import ModLog
@@ -15,32 +18,123 @@ from bot.utils.messages import format_user
 
 log = get_logger(__name__)
 
-LOG_MESSAGE = (
-    "Censored a seemingly valid token sent by {author} in {channel}, "
-    "token was `{user_id}.{timestamp}.{hmac}`"
-)
-UNKNOWN_USER_LOG_MESSAGE = "Decoded user ID: `{user_id}` (Not present in server)."
-KNOWN_USER_LOG_MESSAGE = (
-    "Decoded user ID: `{user_id}` **(Present in server)**.\n"
-    "This matches `{user_name}` and means this is likely a valid **{kind}** token."
-)
-DELETION_MESSAGE_TEMPLATE = (
-    "Hey {mention}! I noticed you posted a seemingly valid Discord API "
-    "token in your message and have removed your message. "
-    "This means that your token has been **compromised**. "
-    "Please change your token **immediately** at: "
-    "<https://discord.com/developers/applications>\n\n"
-    "Feel free to re-post it with the token removed. "
-    "If you believe this was a mistake, please let us know!"
-)
 DISCORD_EPOCH = 1_420_070_400
 TOKEN_EPOCH = 1_293_840_000
+# Four or fewer base64 characters decode to at most 3 bytes, which is always smaller than
+# DISCORD_EPOCH - TOKEN_EPOCH, and five characters can't be decoded at all.
+MIN_TIMESTAMP_LENGTH = 6
+MAX_USER_ID_LENGTH = 28
+
+
+# The messages are f-strings in functions rather than `str.format` templates,
+# so they're parsed once at compile time instead of on every removed token.
+def _censor_log_message(author: str, channel: str, user_id: str, timestamp: str, hmac: str) -> str:
+    """Return the generic log message for a censored token."""
+    return (
+        f"Censored a seemingly valid token sent by {author} in {channel}, "
+        f"token was `{user_id}.{timestamp}.{hmac}`"
+    )
+
+
+def _unknown_user_log_message(user_id: int) -> str:
+    """Return the log message for a decoded user ID that isn't in the server."""
+    return f"Decoded user ID: `{user_id}` (Not present in server)."
+
+
+def _known_user_log_message(user_id: int, user_name: str, kind: str) -> str:
+    """Return the log message for a decoded user ID that is in the server."""
+    return (
+        f"Decoded user ID: `{user_id}` **(Present in server)**.\n"
+        f"This matches `{user_name}` and means this is likely a valid **{kind}** token."
+    )
+
+
+def _deletion_message(mention: str) -> str:
+    """Return the message telling the author at `mention` that their token was removed."""
+    return (
+        f"Hey {mention}! I noticed you posted a seemingly valid Discord API "
+        "token in your message and have removed your message. "
+        "This means that your token has been **compromised**. "
+        "Please change your token **immediately** at: "
+        "<https://discord.com/developers/applications>\n\n"
+        "Feel free to re-post it with the token removed. "
+        "If you believe this was a mistake, please let us know!"
+    )
+
+
+# User IDs are encoded ASCII digits, and every digit byte starts with the same few bits,
+# so the encoded user ID can only start with one of a handful of base64 characters.
+USER_ID_FIRST_CHARS = "".join(sorted(
+    {base64.urlsafe_b64encode(digit.encode())[:1].decode() for digit in string.digits}
+))
 
 # Three parts delimited by dots: user ID, creation timestamp, HMAC.
 # The HMAC isn't parsed further, but it's in the regex to ensure it at least exists in the string.
 # Each part only matches base64 URL-safe characters.
-# These regexes were taken from discord-developers, which are used by the client itself.
-TOKEN_RE = re.compile(r"([\w-]{10,})\.([\w-]{5,})\.([\w-]{10,})")
+# The part lengths are bounded by what real tokens use (a 17-20 digit user ID, a 4 byte timestamp,
+# and a 27-38 character HMAC), and the lookarounds stop a match from starting or ending in the
+# middle of a longer base64 run, which keeps the scan linear on long pastes.
+# Timestamps too short to reach the Discord epoch are rejected here rather than after matching.
+# The user ID must also start with a character that can begin an encoded digit.
+TOKEN_RE = regex.compile(
+    (
+        rf"(?<![\w-])([{USER_ID_FIRST_CHARS}][\w-]{{9,{MAX_USER_ID_LENGTH - 1}}})"
+        rf"\.([\w-]{{{MIN_TIMESTAMP_LENGTH},12}})\.([\w-]{{20,40}})(?![\w-])"
+    ).encode(),
+    regex.ASCII,
+)
+
+
+def _has_token_dots(content: str) -> bool:
+    """Return True if `content` has the two dots a token needs."""
+    first_dot = content.find(".")
+    return first_dot != -1 and content.find(".", first_dot + 1) != -1
+
+
+def _token_search_start(content: bytes) -> int:
+    """Return the earliest position a token could start at in the encoded `content`, which must contain a dot."""
+    # A token can't start more than a user ID's length before the first dot.
+    return max(0, content.find(b".") - MAX_USER_ID_LENGTH)
+
+
+_URLSAFE_TO_STANDARD_B64 = bytes.maketrans(b"-_", b"+/")
+
+
+def _decode_base64(b64_content: str) -> bytes:
+    """
+    Decode the unpadded URL-safe base64 `b64_content`.
+
+    This goes straight to `binascii` rather than through the `base64` module's wrappers.
+    Raise a ValueError if `b64_content` isn't valid base64.
+    """
+    raw = b64_content.encode("ascii").translate(_URLSAFE_TO_STANDARD_B64)
+    raw += b"=" * (-len(raw) & 3)
+    return binascii.a2b_base64(raw)
+
+
+# The token parts are cached since spam tends to repeat the same candidate across many messages.
+# Logging is left to the uncached `TokenRemover` methods, so rejections are logged every time.
+@functools.lru_cache(maxsize=4096)
+def _decode_user_id(b64_content: str) -> t.Optional[int]:
+    """Return the user ID integer encoded in `b64_content`, or None if it couldn't be decoded."""
+    try:
+        decoded_bytes = _decode_base64(b64_content)
+    except ValueError:
+        return None
+
+    # `bytes.isdigit` only accepts ASCII digits, so fancy unicode digits in the encoding are rejected too.
+    if not decoded_bytes.isdigit():
+        return None
+    return int(decoded_bytes)
+
+
+@functools.lru_cache(maxsize=4096)
+def _decode_timestamp(b64_content: str) -> t.Optional[int]:
+    """Return the timestamp integer encoded in `b64_content`, or None if it couldn't be decoded."""
+    try:
+        return int.from_bytes(_decode_base64(b64_content), byteorder="big")
+    except ValueError:
+        return None
 
 
 class Token(t.NamedTuple):
@@ -73,9 +167,21 @@ class TokenRemover(Cog):
         if not msg.guild or msg.author.bot:
             return
 
-        found_token = self.find_token_in_message(msg)
-        if found_token:
-            await self.take_action(msg, found_token)
+        # Most messages are rejected here; only the rest are scanned, in a task so the listener doesn't wait on it.
+        if not _has_token_dots(msg.content):
+            return
+
+        scheduling.create_task(self._scan_and_act(msg, msg.content))
+
+    async def _scan_and_act(self, msg: Message, content: str) -> None:
+        """Take action on `msg` if its `content` contains a seemingly valid token."""
+        # Tokens are pure ASCII, so the pattern is matched against the encoded bytes, which `regex` scans faster.
+        # Only messages that passed the dot check get here, so the rest are never encoded.
+        encoded = content.encode("utf-8", "surrogatepass")
+        found = self.find_token_in_message(encoded, _token_search_start(encoded))
+        if found:
+            found_token, user_id = found
+            await self.take_action(msg, found_token, user_id)
 
     @Cog.listener()
     async def on_message_edit(self, before: Message, after: Message) -> None:
@@ -84,10 +190,18 @@ class TokenRemover(Cog):
 
         See: https://discordapp.com/developers/docs/reference#snowflakes
         """
+        # Edits that don't touch the content (e.g. Discord adding link embeds) can't introduce a token.
+        if before.content == after.content:
+            return
+
         await self.on_message(after)
 
-    async def take_action(self, msg: Message, found_token: Token) -> None:
-        """Remove the `msg` containing the `found_token` and send a mod log message."""
+    async def take_action(self, msg: Message, found_token: Token, user_id: int) -> None:
+        """
+        Remove the `msg` containing the `found_token` and send a mod log message.
+
+        `user_id` is the ID already decoded from the token's first part.
+        """
         self.mod_log.ignore(Event.message_delete, msg.id)
 
         try:
@@ -96,10 +210,10 @@ class TokenRemover(Cog):
             log.debug(f"Failed to remove token in message {msg.id}: message already deleted.")
             return
 
-        await msg.channel.send(DELETION_MESSAGE_TEMPLATE.format(mention=msg.author.mention))
+        await msg.channel.send(_deletion_message(mention=msg.author.mention))
 
         log_message = self.format_log_message(msg, found_token)
-        userid_message, mention_everyone = await self.format_userid_log_message(msg, found_token)
+        userid_message, mention_everyone = await self.format_userid_log_message(msg, user_id)
         log.debug(log_message)
 
         # Send pretty mod log embed to mod-alerts
@@ -115,8 +229,8 @@ class TokenRemover(Cog):
 
         self.bot.stats.incr("tokens.removed_tokens")
 
-    @classmethod
-    async def format_userid_log_message(cls, msg: Message, token: Token) -> t.Tuple[str, bool]:
+    @staticmethod
+    async def format_userid_log_message(msg: Message, user_id: int) -> t.Tuple[str, bool]:
         """
         Format the portion of the log message that includes details about the detected user ID.
 
@@ -127,22 +241,21 @@ class TokenRemover(Cog):
 
         Returns a tuple of (log_message, mention_everyone)
         """
-        user_id = cls.extract_user_id(token.user_id)
         user = await get_or_fetch_member(msg.guild, user_id)
 
         if user:
-            return KNOWN_USER_LOG_MESSAGE.format(
+            return _known_user_log_message(
                 user_id=user_id,
                 user_name=str(user),
                 kind="BOT" if user.bot else "USER",
             ), True
         else:
-            return UNKNOWN_USER_LOG_MESSAGE.format(user_id=user_id), False
+            return _unknown_user_log_message(user_id=user_id), False
 
     @staticmethod
     def format_log_message(msg: Message, token: Token) -> str:
         """Return the generic portion of the log message to send for `token` being censored in `msg`."""
-        return LOG_MESSAGE.format(
+        return _censor_log_message(
             author=format_user(msg.author),
             channel=msg.channel.mention,
             user_id=token.user_id,
@@ -151,38 +264,42 @@ class TokenRemover(Cog):
         )
 
     @classmethod
-    def find_token_in_message(cls, msg: Message) -> t.Optional[Token]:
-        """Return a seemingly valid token found in `msg` or `None` if no token is found."""
-        # Use finditer rather than search to guard against method calls prematurely returning the
-        # token check (e.g. `message.channel.send` also matches our token pattern)
-        for match in TOKEN_RE.finditer(msg.content):
-            token = Token(*match.groups())
-            if (
-                (cls.extract_user_id(token.user_id) is not None)
-                and cls.is_valid_timestamp(token.timestamp)
-                and cls.is_maybe_valid_hmac(token.hmac)
-            ):
+    def find_token_in_message(cls, content: bytes, pos: int) -> t.Optional[t.Tuple[Token, int]]:
+        """
+        Return a seemingly valid token found in the encoded message `content` from `pos` on, or `None` if not found.
+
+        The token is returned along with the user ID decoded from it, so it only has to be decoded once.
+        """
+        # Keep searching past invalid matches to guard against method calls prematurely returning the
+        # token check (e.g. `message.channel.send` also matches our token pattern).
+        # Resuming right after the first part of an invalid match also catches a token that overlaps it.
+        while (match := TOKEN_RE.search(content, pos)) is not None:
+            found = cls._validate_match(match)
+            if found:
                 # Short-circuit on first match
-                return token
+                return found
+            pos = match.end(1) + 1
 
         # No matching substring
         return None
 
+    @classmethod
+    def _validate_match(cls, match: regex.Match) -> t.Optional[t.Tuple[Token, int]]:
+        """Return the token in `match` and its decoded user ID if every part of it looks valid, else None."""
+        user_id_b64, timestamp_b64, hmac = (group.decode("ascii") for group in match.groups())
+
+        user_id = cls.extract_user_id(user_id_b64)
+        if user_id is None:
+            return None
+        if not (cls.is_valid_timestamp(timestamp_b64) and cls.is_maybe_valid_hmac(hmac)):
+            return None
+
+        return Token(user_id_b64, timestamp_b64, hmac), user_id
+
     @staticmethod
     def extract_user_id(b64_content: str) -> t.Optional[int]:
         """Return a user ID integer from part of a potential token, or None if it couldn't be decoded."""
-        b64_content = utils.pad_base64(b64_content)
-
-        try:
-            decoded_bytes = base64.urlsafe_b64decode(b64_content)
-            string = decoded_bytes.decode('utf-8')
-            if not (string.isascii() and string.isdigit()):
-                # This case triggers if there are fancy unicode digits in the base64 encoding,
-                # that means it's not a valid user id.
-                return None
-            return int(string)
-        except ValueError:
-            return None
+        return _decode_user_id(b64_content)
 
     @staticmethod
     def is_valid_timestamp(b64_content: str) -> bool:
@@ -192,13 +309,14 @@ class TokenRemover(Cog):
         If the timestamp is greater than the Discord epoch, it's probably valid.
         See: https://i.imgur.com/7WdehGn.png
         """
-        b64_content = utils.pad_base64(b64_content)
+        # TOKEN_RE already rejects these; this only guards direct callers.
+        if len(b64_content) < MIN_TIMESTAMP_LENGTH:
+            log.debug(f"Invalid token timestamp '{b64_content}': too short to reach the Discord epoch")
+            return False
 
-        try:
-            decoded_bytes = base64.urlsafe_b64decode(b64_content)
-            timestamp = int.from_bytes(decoded_bytes, byteorder="big")
-        except ValueError as e:
-            log.debug(f"Failed to decode token timestamp '{b64_content}': {e}")
+        timestamp = _decode_timestamp(b64_content)
+        if timestamp is None:
+            log.debug(f"Failed to decode token timestamp '{b64_content}'")
             return False
 
         # Seems like newer tokens don't need the epoch added, but add anyway since an upper bound
@@ -7,20 +7,29 @@ async def apply(
     last_message: Message, recent_messages: List[Message], config: Dict[str, int]
 ) -> Optional[Tuple[str, Iterable[Member], Iterable[Message]]]:
     """Detects total attachments exceeding the limit sent by a single user."""
+    # A message without attachments can't push the total over the limit, so there's nothing new to detect.
+    if not last_message.attachments:
+        return None
+
+    # discord.py builds a separate `Member` for each message's author, so compare the IDs directly.
+    author_id = last_message.author.id
+    total_recent_attachments = 0
+
+    for msg in recent_messages:
+        if msg.author.id == author_id:
+            total_recent_attachments += len(msg.attachments)
+
+    if total_recent_attachments <= config['max']:
+        return None
+
+    # The rule rarely triggers, so only collect the offending messages once it has.
     relevant_messages = tuple(
         msg
         for msg in recent_messages
-        if (
-            msg.author == last_message.author
-            and len(msg.attachments) > 0
-        )
+        if msg.author.id == author_id and msg.attachments
+    )
+    return (
+        f"sent {total_recent_attachments} attachments in {config['interval']}s",
+        (last_message.author,),
+        relevant_messages
     )
-    total_recent_attachments = sum(len(msg.attachments) for msg in relevant_messages)
-
-    if total_recent_attachments > config['max']:
-        return (
-            f"sent {total_recent_attachments} attachments in {config['interval']}s",
-            (last_message.author,),
-            relevant_messages
-        )
-    return None
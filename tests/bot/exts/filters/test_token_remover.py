@@ -1,9 +1,9 @@
 import unittest
-from re import Match
 from unittest import mock
 from unittest.mock import MagicMock
 
 from discord import Colour, NotFound
+from regex import Match
 
 from bot import constants
 from bot.exts.filters import token_remover
@@ -88,6 +88,20 @@ class TokenRemoverTests(unittest.IsolatedAsyncioTestCase):
                 result = TokenRemover.is_valid_timestamp(timestamp)
                 self.assertFalse(result)
 
+    @autospec("bot.exts.filters.token_remover", "log")
+    def test_is_valid_timestamp_logs_repeated_rejections(self, logger):
+        """A rejected timestamp should be logged every time it's seen, even though decoding it is cached."""
+        for _ in range(2):
+            self.assertFalse(TokenRemover.is_valid_timestamp("B4Yffw"))
+
+        self.assertEqual(logger.debug.call_count, 2)
+
+    @autospec("bot.exts.filters.token_remover", "_decode_base64")
+    def test_is_valid_timestamp_short_skips_decoding(self, decode_base64):
+        """Timestamps too short to reach the Discord epoch should be rejected without decoding them."""
+        self.assertFalse(TokenRemover.is_valid_timestamp("_____"))
+        decode_base64.assert_not_called()
+
     def test_is_valid_hmac_valid(self):
         """Should consider an HMAC valid if it has at least 3 unique characters."""
         valid_hmacs = (
@@ -126,52 +140,123 @@ class TokenRemoverTests(unittest.IsolatedAsyncioTestCase):
         """The edit listener should delegate handling of the message to the normal listener."""
         self.cog.on_message = mock.create_autospec(self.cog.on_message, spec_set=True)
 
-        await self.cog.on_message_edit(MockMessage(), self.msg)
+        await self.cog.on_message_edit(MockMessage(content="hello"), self.msg)
         self.cog.on_message.assert_awaited_once_with(self.msg)
 
-    @autospec(TokenRemover, "find_token_in_message", "take_action")
-    async def test_on_message_takes_action(self, find_token_in_message, take_action):
-        """Should take action if a valid token is found when a message is sent."""
+    async def test_on_message_edit_skips_unchanged_content(self):
+        """The edit listener shouldn't scan a message again if its content didn't change."""
+        self.cog.on_message = mock.create_autospec(self.cog.on_message, spec_set=True)
+
+        await self.cog.on_message_edit(MockMessage(content=self.msg.content), self.msg)
+        self.cog.on_message.assert_not_awaited()
+
+    @autospec("bot.exts.filters.token_remover", "scheduling")
+    @autospec(TokenRemover, "_scan_and_act")
+    async def test_on_message_schedules_scan(self, scan_and_act, scheduling):
+        """Should scan the message in a task if it has enough dots to contain a token."""
         cog = TokenRemover(self.bot)
-        found_token = "foobar"
-        find_token_in_message.return_value = found_token
+        self.msg.content = "foo.bar.baz"
 
         await cog.on_message(self.msg)
 
-        find_token_in_message.assert_called_once_with(self.msg)
-        take_action.assert_awaited_once_with(cog, self.msg, found_token)
+        scheduling.create_task.assert_called_once()
+        await scheduling.create_task.call_args.args[0]
+        scan_and_act.assert_awaited_once_with(cog, self.msg, "foo.bar.baz")
 
-    @autospec(TokenRemover, "find_token_in_message", "take_action")
-    async def test_on_message_skips_missing_token(self, find_token_in_message, take_action):
-        """Shouldn't take action if a valid token isn't found when a message is sent."""
+    @autospec("bot.exts.filters.token_remover", "scheduling")
+    @autospec(TokenRemover, "_scan_and_act")
+    async def test_on_message_skips_messages_without_dots(self, scan_and_act, scheduling):
+        """Shouldn't scan a message with too few dots to contain a token."""
         cog = TokenRemover(self.bot)
-        find_token_in_message.return_value = False
 
-        await cog.on_message(self.msg)
+        for content in ("hello world", "hello. world"):
+            with self.subTest(content=content):
+                self.msg.content = content
 
-        find_token_in_message.assert_called_once_with(self.msg)
-        take_action.assert_not_awaited()
+                await cog.on_message(self.msg)
 
-    @autospec(TokenRemover, "find_token_in_message")
-    async def test_on_message_ignores_dms_bots(self, find_token_in_message):
+                scan_and_act.assert_not_called()
+                scheduling.create_task.assert_not_called()
+
+    @autospec("bot.exts.filters.token_remover", "scheduling")
+    async def test_on_message_ignores_dms_bots(self, scheduling):
         """Shouldn't parse a message if it is a DM or authored by a bot."""
         cog = TokenRemover(self.bot)
-        dm_msg = MockMessage(guild=None)
-        bot_msg = MockMessage(author=MagicMock(bot=True))
+        dm_msg = MockMessage(guild=None, content="foo.bar.baz")
+        bot_msg = MockMessage(author=MagicMock(bot=True), content="foo.bar.baz")
 
         for msg in (dm_msg, bot_msg):
             await cog.on_message(msg)
-            find_token_in_message.assert_not_called()
+            scheduling.create_task.assert_not_called()
+
+    @autospec(TokenRemover, "find_token_in_message", "take_action")
+    async def test_scan_and_act_takes_action(self, find_token_in_message, take_action):
+        """Should take action if a valid token is found in the message."""
+        cog = TokenRemover(self.bot)
+        found_token = "foobar"
+        find_token_in_message.return_value = (found_token, 42)
+
+        await cog._scan_and_act(self.msg, "foo.bar.baz")
+
+        find_token_in_message.assert_called_once_with(b"foo.bar.baz", 0)
+        take_action.assert_awaited_once_with(cog, self.msg, found_token, 42)
+
+    @autospec(TokenRemover, "find_token_in_message", "take_action")
+    async def test_scan_and_act_skips_missing_token(self, find_token_in_message, take_action):
+        """Shouldn't take action if a valid token isn't found in the message."""
+        cog = TokenRemover(self.bot)
+        find_token_in_message.return_value = None
+
+        await cog._scan_and_act(self.msg, "foo.bar.baz")
+
+        find_token_in_message.assert_called_once_with(b"foo.bar.baz", 0)
+        take_action.assert_not_awaited()
+
+    @autospec(TokenRemover, "find_token_in_message", "take_action")
+    async def test_scan_and_act_searches_from_byte_offset(self, find_token_in_message, take_action):
+        """The search should start from the first dot's offset in the encoded content, not in the str."""
+        cog = TokenRemover(self.bot)
+        find_token_in_message.return_value = None
+        content = "é" * 50 + "foo.bar.baz"
+
+        await cog._scan_and_act(self.msg, content)
+
+        find_token_in_message.assert_called_once_with(content.encode(), 103 - token_remover.MAX_USER_ID_LENGTH)
+
+    def test_has_token_dots(self):
+        """Content needs at least two dots to contain a token."""
+        cases = (
+            ("hello world", False),
+            ("hello. world", False),
+            ("foo.bar.baz", True),
+            ("foo..", True),
+        )
+        for content, expected in cases:
+            with self.subTest(content=content):
+                self.assertIs(token_remover._has_token_dots(content), expected)
+
+    def test_token_search_start_skips_prefix_before_first_dot(self):
+        """The search should start no earlier than a user ID's length before the first dot."""
+        cases = (
+            (b"foo.bar.baz", 0),
+            (b"x" * 100 + b".bar.baz", 100 - token_remover.MAX_USER_ID_LENGTH),
+            # The position is a byte offset, so multi-byte characters count for each of their bytes.
+            ("é".encode() * 50 + b"foo.bar.baz", 103 - token_remover.MAX_USER_ID_LENGTH),
+        )
+
+        for content, start in cases:
+            with self.subTest(content=content):
+                self.assertEqual(token_remover._token_search_start(content), start)
 
     @autospec("bot.exts.filters.token_remover", "TOKEN_RE")
     def test_find_token_no_matches(self, token_re):
         """None should be returned if the regex matches no tokens in a message."""
-        token_re.finditer.return_value = ()
+        token_re.search.return_value = None
 
-        return_value = TokenRemover.find_token_in_message(self.msg)
+        return_value = TokenRemover.find_token_in_message(b"hello.world.bye", 0)
 
         self.assertIsNone(return_value)
-        token_re.finditer.assert_called_once_with(self.msg.content)
+        token_re.search.assert_called_once_with(b"hello.world.bye", 0)
 
     @autospec(TokenRemover, "extract_user_id", "is_valid_timestamp", "is_maybe_valid_hmac")
     @autospec("bot.exts.filters.token_remover", "Token")
@@ -184,26 +269,31 @@ class TokenRemoverTests(unittest.IsolatedAsyncioTestCase):
         is_valid_timestamp,
         is_maybe_valid_hmac,
     ):
-        """The first match with a valid user ID, timestamp, and HMAC should be returned as a `Token`."""
+        """The first match with a valid user ID, timestamp, and HMAC should be returned with its user ID."""
         matches = [
             mock.create_autospec(Match, spec_set=True, instance=True),
             mock.create_autospec(Match, spec_set=True, instance=True),
         ]
-        tokens = [
-            mock.create_autospec(Token, spec_set=True, instance=True),
-            mock.create_autospec(Token, spec_set=True, instance=True),
-        ]
+        matches[0].groups.return_value = (b"a", b"b", b"c")
+        matches[1].groups.return_value = (b"d", b"e", b"f")
+        matches[0].end.return_value = 3
+        token = mock.create_autospec(Token, spec_set=True, instance=True)
 
-        token_re.finditer.return_value = matches
-        token_cls.side_effect = tokens
-        extract_user_id.side_effect = (None, True)  # The 1st match will be invalid, 2nd one valid.
+        token_re.search.side_effect = matches
+        token_cls.return_value = token
+        extract_user_id.side_effect = (None, 42)  # The 1st match will be invalid, 2nd one valid.
         is_valid_timestamp.return_value = True
         is_maybe_valid_hmac.return_value = True
 
-        return_value = TokenRemover.find_token_in_message(self.msg)
+        return_value = TokenRemover.find_token_in_message(b"foo.bar.baz", 0)
 
-        self.assertEqual(tokens[1], return_value)
-        token_re.finditer.assert_called_once_with(self.msg.content)
+        self.assertEqual((token, 42), return_value)
+        # The search should resume right after the user ID of the invalid match.
+        token_re.search.assert_has_calls((mock.call(b"foo.bar.baz", 0), mock.call(b"foo.bar.baz", 4)))
+        matches[0].end.assert_called_once_with(1)
+        extract_user_id.assert_has_calls((mock.call("a"), mock.call("d")))
+        is_valid_timestamp.assert_called_once_with("e")
+        token_cls.assert_called_once_with("d", "e", "f")
 
     @autospec(TokenRemover, "extract_user_id", "is_valid_timestamp", "is_maybe_valid_hmac")
     @autospec("bot.exts.filters.token_remover", "Token")
@@ -217,16 +307,37 @@ class TokenRemoverTests(unittest.IsolatedAsyncioTestCase):
         is_maybe_valid_hmac,
     ):
         """None should be returned if no matches have valid user IDs, HMACs, and timestamps."""
-        token_re.finditer.return_value = [mock.create_autospec(Match, spec_set=True, instance=True)]
+        match = mock.create_autospec(Match, spec_set=True, instance=True)
+        match.groups.return_value = (b"a", b"b", b"c")
+        match.end.return_value = 3
+        token_re.search.side_effect = (match, None)
         token_cls.return_value = mock.create_autospec(Token, spec_set=True, instance=True)
         extract_user_id.return_value = None
         is_valid_timestamp.return_value = False
         is_maybe_valid_hmac.return_value = False
 
-        return_value = TokenRemover.find_token_in_message(self.msg)
+        return_value = TokenRemover.find_token_in_message(b"foo.bar.baz", 0)
 
         self.assertIsNone(return_value)
-        token_re.finditer.assert_called_once_with(self.msg.content)
+        self.assertEqual(token_re.search.call_count, 2)
+
+    def test_find_token_overlapping_invalid_match(self):
+        """A valid token should be found even if it overlaps the end of an invalid match."""
+        token = "NDcyMjY1OTQzMDYyNDEzMzMy.XsyRkw.VXmErH7j511turNpfURmb0rVNm8"
+        content = f"Maaaaaaaaa.bbbbbbb.{token}".encode()
+
+        return_value = TokenRemover.find_token_in_message(content, 0)
+
+        self.assertEqual(return_value, (Token(*token.split(".")), 472265943062413332))
+
+    def test_find_token_after_non_ascii_text(self):
+        """A token should be found when it follows non-ASCII text."""
+        token = "NDcyMjY1OTQzMDYyNDEzMzMy.XsyRkw.VXmErH7j511turNpfURmb0rVNm8"
+        content = f"Þíß ïß ňøẗ åšçíí... {token}".encode()
+
+        return_value = TokenRemover.find_token_in_message(content, token_remover._token_search_start(content))
+
+        self.assertEqual(return_value, (Token(*token.split(".")), 472265943062413332))
 
     def test_regex_invalid_tokens(self):
         """Messages without anything looking like a token are not matched."""
@@ -245,11 +356,17 @@ class TokenRemoverTests(unittest.IsolatedAsyncioTestCase):
             "hellö.world.bye",
             "base64.nötbåse64.morebase64",
             "19jd3J.dfkm3d.€víł§tüff",
+            "NDcyMjY1OTQzMDYyNDEzMzMyNDcyMjY1OTQz.XsyRkw.VXmErH7j511turNpfURmb0rVNm8",
+            "NDcyMjY1OTQzMDYyNDEzMzMy.XsyRkwXsyRkwXsyRkw.VXmErH7j511turNpfURmb0rVNm8",
+            "NDcyMjY1OTQzMDYyNDEzMzMy.XsyRkw.VXmErH7j511turNpfURmb0rVNm8VXmErH7j511turNpfURmb0rVNm8",
+            "NDcyMjY1OTQzMDYyNDEzMzMy.XsyRkw.VXmErH7j",
+            "NDcyMjY1OTQzMDYyNDEzMzMy.XsyRk.VXmErH7j511turNpfURmb0rVNm8",
+            "SGVsbG8gd29ybGQhISEh.XsyRkw.VXmErH7j511turNpfURmb0rVNm8",
         )
 
         for token in tokens:
             with self.subTest(token=token):
-                results = token_remover.TOKEN_RE.findall(token)
+                results = token_remover.TOKEN_RE.findall(token.encode())
                 self.assertEqual(len(results), 0)
 
     def test_regex_valid_tokens(self):
@@ -264,29 +381,33 @@ class TokenRemoverTests(unittest.IsolatedAsyncioTestCase):
 
         for token in tokens:
             with self.subTest(token=token):
-                results = token_remover.TOKEN_RE.fullmatch(token)
+                results = token_remover.TOKEN_RE.fullmatch(token.encode())
                 self.assertIsNotNone(results, f"{token} was not matched by the regex")
 
+    def test_user_id_first_chars(self):
+        """Only the first characters of base64 encoded digits should be allowed to start a user ID."""
+        self.assertEqual(token_remover.USER_ID_FIRST_CHARS, "MNO")
+
     def test_regex_matches_multiple_valid(self):
         """Should support multiple matches in the middle of a string."""
         token_1 = "NDY3MjIzMjMwNjUwNzc3NjQx.XsyWGg.uFNEQPCc4ePwGh7egG8UicQssz8"
         token_2 = "NDcyMjY1OTQzMDYyNDEzMzMy.XsyWMw.l8XPnDqb0lp-EiQ2g_0xVFT1pyc"
         message = f"garbage {token_1} hello {token_2} world"
 
-        results = token_remover.TOKEN_RE.finditer(message)
-        results = [match[0] for match in results]
+        results = token_remover.TOKEN_RE.finditer(message.encode())
+        results = [match[0].decode() for match in results]
         self.assertCountEqual((token_1, token_2), results)
 
-    @autospec("bot.exts.filters.token_remover", "LOG_MESSAGE")
+    @autospec("bot.exts.filters.token_remover", "_censor_log_message")
     def test_format_log_message(self, log_message):
         """Should correctly format the log message with info from the message and token."""
         token = Token("NDcyMjY1OTQzMDYyNDEzMzMy", "XsySD_", "s45jqDV_Iisn-symw0yDRrk_jf4")
-        log_message.format.return_value = "Howdy"
+        log_message.return_value = "Howdy"
 
         return_value = TokenRemover.format_log_message(self.msg, token)
 
-        self.assertEqual(return_value, log_message.format.return_value)
-        log_message.format.assert_called_once_with(
+        self.assertEqual(return_value, log_message.return_value)
+        log_message.assert_called_once_with(
             author=format_user(self.msg.author),
             channel=self.msg.channel.mention,
             user_id=token.user_id,
@@ -294,49 +415,46 @@ class TokenRemoverTests(unittest.IsolatedAsyncioTestCase):
             hmac="xxxxxxxxxxxxxxxxxxxxxxxxjf4",
         )
 
-    @autospec("bot.exts.filters.token_remover", "UNKNOWN_USER_LOG_MESSAGE")
+    @autospec("bot.exts.filters.token_remover", "_unknown_user_log_message")
     async def test_format_userid_log_message_unknown(self, unknown_user_log_message,):
         """Should correctly format the user ID portion when the actual user it belongs to is unknown."""
-        token = Token("NDcyMjY1OTQzMDYyNDEzMzMy", "XsySD_", "s45jqDV_Iisn-symw0yDRrk_jf4")
-        unknown_user_log_message.format.return_value = " Partner"
+        unknown_user_log_message.return_value = " Partner"
         msg = MockMessage(id=555, content="hello world")
         msg.guild.get_member.return_value = None
         msg.guild.fetch_member.side_effect = NotFound(mock.Mock(status=404), "Not found")
 
-        return_value = await TokenRemover.format_userid_log_message(msg, token)
+        return_value = await TokenRemover.format_userid_log_message(msg, 472265943062413332)
 
-        self.assertEqual(return_value, (unknown_user_log_message.format.return_value, False))
-        unknown_user_log_message.format.assert_called_once_with(user_id=472265943062413332)
+        self.assertEqual(return_value, (unknown_user_log_message.return_value, False))
+        unknown_user_log_message.assert_called_once_with(user_id=472265943062413332)
 
-    @autospec("bot.exts.filters.token_remover", "KNOWN_USER_LOG_MESSAGE")
+    @autospec("bot.exts.filters.token_remover", "_known_user_log_message")
     async def test_format_userid_log_message_bot(self, known_user_log_message):
         """Should correctly format the user ID portion when the ID belongs to a known bot."""
-        token = Token("NDcyMjY1OTQzMDYyNDEzMzMy", "XsySD_", "s45jqDV_Iisn-symw0yDRrk_jf4")
-        known_user_log_message.format.return_value = " Partner"
+        known_user_log_message.return_value = " Partner"
         msg = MockMessage(id=555, content="hello world")
         msg.guild.get_member.return_value.__str__.return_value = "Sam"
         msg.guild.get_member.return_value.bot = True
 
-        return_value = await TokenRemover.format_userid_log_message(msg, token)
+        return_value = await TokenRemover.format_userid_log_message(msg, 472265943062413332)
 
-        self.assertEqual(return_value, (known_user_log_message.format.return_value, True))
+        self.assertEqual(return_value, (known_user_log_message.return_value, True))
 
-        known_user_log_message.format.assert_called_once_with(
+        known_user_log_message.assert_called_once_with(
             user_id=472265943062413332,
             user_name="Sam",
             kind="BOT",
         )
 
-    @autospec("bot.exts.filters.token_remover", "KNOWN_USER_LOG_MESSAGE")
+    @autospec("bot.exts.filters.token_remover", "_known_user_log_message")
     async def test_format_log_message_user_token_user(self, user_token_message):
         """Should correctly format the user ID portion when the ID belongs to a known user."""
-        token = Token("NDY3MjIzMjMwNjUwNzc3NjQx", "XsySD_", "s45jqDV_Iisn-symw0yDRrk_jf4")
-        user_token_message.format.return_value = "Partner"
+        user_token_message.return_value = "Partner"
 
-        return_value = await TokenRemover.format_userid_log_message(self.msg, token)
+        return_value = await TokenRemover.format_userid_log_message(self.msg, 467223230650777641)
 
-        self.assertEqual(return_value, (user_token_message.format.return_value, True))
-        user_token_message.format.assert_called_once_with(
+        self.assertEqual(return_value, (user_token_message.return_value, True))
+        user_token_message.assert_called_once_with(
             user_id=467223230650777641,
             user_name="Woody",
             kind="USER",
@@ -350,7 +468,6 @@ class TokenRemoverTests(unittest.IsolatedAsyncioTestCase):
         cog = TokenRemover(self.bot)
         mod_log = mock.create_autospec(ModLog, spec_set=True, instance=True)
         token = mock.create_autospec(Token, spec_set=True, instance=True)
-        token.user_id = "no-id"
         log_msg = "testing123"
         userid_log_message = "userid-log-message"
 
@@ -358,15 +475,15 @@ class TokenRemoverTests(unittest.IsolatedAsyncioTestCase):
         format_log_message.return_value = log_msg
         format_userid_log_message.return_value = (userid_log_message, True)
 
-        await cog.take_action(self.msg, token)
+        await cog.take_action(self.msg, token, 42)
 
         self.msg.delete.assert_called_once_with()
         self.msg.channel.send.assert_called_once_with(
-            token_remover.DELETION_MESSAGE_TEMPLATE.format(mention=self.msg.author.mention)
+            token_remover._deletion_message(mention=self.msg.author.mention)
         )
 
         format_log_message.assert_called_once_with(self.msg, token)
-        format_userid_log_message.assert_called_once_with(self.msg, token)
+        format_userid_log_message.assert_called_once_with(self.msg, 42)
         logger.debug.assert_called_with(log_msg)
         self.bot.stats.incr.assert_called_once_with("tokens.removed_tokens")
 
@@ -389,7 +506,7 @@ class TokenRemoverTests(unittest.IsolatedAsyncioTestCase):
         self.msg.delete.side_effect = NotFound(MagicMock(), MagicMock())
 
         token = mock.create_autospec(Token, spec_set=True, instance=True)
-        await cog.take_action(self.msg, token)
+        await cog.take_action(self.msg, token, 42)
 
         self.msg.delete.assert_called_once_with()
         self.msg.channel.send.assert_not_awaited()
@@ -2,12 +2,19 @@ from typing import Iterable
 
 from bot.rules import attachments
 from tests.bot.rules import DisallowedCase, RuleTest
-from tests.helpers import MockMessage
+from tests.helpers import MockMember, MockMessage
+
+MEMBER_IDS = {"alice": 1, "bob": 2}
+
+
+def make_member(name: str) -> MockMember:
+    """Builds a new member object for `name`, which always has the same ID."""
+    return MockMember(id=MEMBER_IDS[name], name=name)
 
 
 def make_msg(author: str, total_attachments: int) -> MockMessage:
-    """Builds a message with `total_attachments` attachments."""
-    return MockMessage(author=author, attachments=list(range(total_attachments)))
+    """Builds a message with `total_attachments` attachments, from its own member object like discord.py does."""
+    return MockMessage(author=make_member(author), attachments=list(range(total_attachments)))
 
 
 class AttachmentRuleTests(RuleTest):
@@ -23,6 +30,7 @@ class AttachmentRuleTests(RuleTest):
             [make_msg("bob", 0), make_msg("bob", 0), make_msg("bob", 0)],
             [make_msg("bob", 2), make_msg("bob", 2)],
             [make_msg("bob", 2), make_msg("alice", 2), make_msg("bob", 2)],
+            [make_msg("bob", 0), make_msg("bob", 6)],  # The latest message adds no attachments.
         )
 
         await self.run_allowed(cases)
@@ -32,24 +40,34 @@ class AttachmentRuleTests(RuleTest):
         cases = (
             DisallowedCase(
                 [make_msg("bob", 4), make_msg("bob", 0), make_msg("bob", 6)],
-                ("bob",),
+                (make_member("bob"),),
                 10,
             ),
             DisallowedCase(
                 [make_msg("bob", 4), make_msg("alice", 6), make_msg("bob", 2)],
-                ("bob",),
+                (make_member("bob"),),
                 6,
             ),
             DisallowedCase(
                 [make_msg("alice", 6)],
-                ("alice",),
+                (make_member("alice"),),
                 6,
             ),
             DisallowedCase(
                 [make_msg("alice", 1) for _ in range(6)],
-                ("alice",),
+                (make_member("alice"),),
                 6,
             ),
+            DisallowedCase(
+                [make_msg("bob", 3), make_msg("bob", 3), make_msg("bob", 3)],
+                (make_member("bob"),),
+                9,
+            ),
+            DisallowedCase(
+                [make_msg("bob", 6), make_msg("bob", 3), make_msg("bob", 2)],
+                (make_member("bob"),),
+                11,
+            ),
         )
 
         await self.run_disallowed(cases)